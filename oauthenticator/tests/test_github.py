@@ -1,9 +1,11 @@
+import asyncio
+import contextlib
 import functools
 import json
 import logging
 import re
 from io import BytesIO
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs
 
 from pytest import fixture, mark, raises
 from tornado.httpclient import HTTPResponse
@@ -13,9 +15,44 @@ from traitlets.config import Config
 from ..github import GitHubOAuthenticator
 from .mocks import setup_oauth_mock
 
+try:
+    from orjson import dumps as _json_bytes
+except ImportError:
 
+    def _json_bytes(obj):
+        return json.dumps(obj).encode('utf-8')
+
+
+log = logging.getLogger(__name__)
+
+_MEMBER_RE = re.compile(r'/orgs/([^/]+)/members$')
+_ORG_MEMBERSHIP_RE = re.compile(r'/orgs/([^/]+)/members/([^/]+)$')
+_TEAM_MEMBERSHIP_RE = re.compile(r'/orgs/([^/]+)/teams/([^/]+)/members/([^/]+)$')
+
+# shared by all mocked JSON responses, copy it before adding headers
+_JSON_HEADERS = HTTPHeaders({'Content-Type': 'application/json'})
+
+# org members served by the mocked GitHub API, in the order they are listed
+_ORDERED_ORG_MEMBERS = {
+    "org1": ("user1", "user2"),
+}
+
+# Link headers of the org members pages that have a next page, keyed by
+# (org, page)
+_LINK_HEADER = '<https://api.github.com/orgs/{org}/members?page={page}>;rel="next"'
+_LINK_HEADERS = {
+    (org, page): _LINK_HEADER.format(org=org, page=page + 1)
+    for org, members in _ORDERED_ORG_MEMBERS.items()
+    for page in range(1, len(members))
+}
+
+
+@functools.lru_cache(maxsize=None)
 def user_model(username):
-    """Return a user model"""
+    """Return a user model
+
+    The model is cached and shared between callers, so it must not be mutated.
+    """
     return {
         'email': 'dinosaurs@space',
         'id': 5,
@@ -24,6 +61,32 @@ def user_model(username):
     }
 
 
+@functools.lru_cache(maxsize=None)
+def _members_for(members, page=None):
+    """Return the user models for a tuple of org members, or for a single page"""
+    if page is None:
+        return [user_model(m) for m in members]
+    return [user_model(members[page - 1])]
+
+
+def _page_headers(org, page):
+    """Return the headers of an org members page, linking to the next page"""
+    if (org, page) not in _LINK_HEADERS:
+        return _JSON_HEADERS
+    headers = _JSON_HEADERS.copy()
+    headers.add('Link', _LINK_HEADERS[(org, page)])
+    return headers
+
+
+# JSON bodies and headers of each org members page, keyed by (org, page)
+_PAGED_BODIES = {
+    (org, page): _json_bytes(_members_for(members, page))
+    for org, members in _ORDERED_ORG_MEMBERS.items()
+    for page in range(1, len(members) + 1)
+}
+_PAGED_HEADERS = {key: _page_headers(*key) for key in _PAGED_BODIES}
+
+
 @fixture
 def github_client(client):
     setup_oauth_mock(
@@ -99,137 +162,117 @@ async def test_github(
         assert auth_model == None
 
 
-def make_link_header(urlinfo, page):
-    return {
-        "Link": f'<{urlinfo.scheme}://{urlinfo.netloc}{urlinfo.path}?page={page}>;rel="next"'
-    }
+@contextlib.contextmanager
+def added_hosts(paths, *entries):
+    """Temporarily add (path, handler) entries to a mocked host's paths"""
+    start = len(paths)
+    paths.extend(entries)
+    try:
+        yield
+    finally:
+        del paths[start:]
 
 
-async def test_allowed_org_membership(github_client):
+@mark.parametrize("paginate", [False, True])
+async def test_allowed_org_membership(github_client, paginate):
     authenticator = GitHubOAuthenticator()
 
     ## Mock Github API
 
+    # membership is checked against sets, orgs are listed from the ordered tuples
     allowed_org_members = {
-        "org1": ["user1"],
+        org: frozenset(members) for org, members in _ORDERED_ORG_MEMBERS.items()
     }
     allowed_org_team_members = {
         "org1": {
-            "team1": ["user1"],
+            "team1": frozenset({"user1"}),
         },
     }
 
-    member_regex = re.compile(r'/orgs/(.*)/members')
-
-    def org_members(paginate, request):
-        urlinfo = urlparse(request.url)
-        org = member_regex.match(urlinfo.path).group(1)
+    def org_members(request):
+        # https://api.github.com/orgs/{org}/members?page={page}
+        url, _, query = request.url.partition('?')
+        org = url.rsplit('/', 3)[-2]
 
         if org not in allowed_org_members:
             return HTTPResponse(request, 404)
 
         if not paginate:
-            return [user_model(m) for m in allowed_org_members[org]]
-        else:
-            page = parse_qs(urlinfo.query).get('page', ['1'])
-            page = int(page[0])
-            return org_members_paginated(
-                org, page, urlinfo, functools.partial(HTTPResponse, request)
-            )
+            return _members_for(_ORDERED_ORG_MEMBERS[org])
 
-    def org_members_paginated(org, page, urlinfo, response):
-        if page < len(allowed_org_members[org]):
-            headers = make_link_header(urlinfo, page + 1)
-        elif page == len(allowed_org_members[org]):
-            headers = {}
-        else:
-            return response(400)
+        page = int(parse_qs(query).get('page', ['1'])[0])
+        if (org, page) not in _PAGED_BODIES:
+            return HTTPResponse(request, 400)
 
-        headers.update({'Content-Type': 'application/json'})
-
-        ret = [user_model(allowed_org_members[org][page - 1])]
-
-        return response(
+        return HTTPResponse(
+            request,
             200,
-            headers=HTTPHeaders(headers),
-            buffer=BytesIO(json.dumps(ret).encode('utf-8')),
+            headers=_PAGED_HEADERS[(org, page)],
+            buffer=BytesIO(_PAGED_BODIES[(org, page)]),
         )
 
-    org_membership_regex = re.compile(r'/orgs/(.*)/members/(.*)')
-
     def org_membership(request):
-        urlinfo = urlparse(request.url)
-        urlmatch = org_membership_regex.match(urlinfo.path)
-        org = urlmatch.group(1)
-        username = urlmatch.group(2)
-        print(f"Request org = {org}, username = {username}")
+        # https://api.github.com/orgs/{org}/members/{username}
+        url = request.url.partition('?')[0]
+        _, org, _, username = url.rsplit('/', 4)[-4:]
         if org not in allowed_org_members:
-            print(f"Org not found: org = {org}")
+            log.debug("Org not found: org=%s", org)
             return HTTPResponse(request, 404)
         if username not in allowed_org_members[org]:
-            print(f"Member not found: org = {org}, username = {username}")
+            log.debug("Member not found: org=%s username=%s", org, username)
             return HTTPResponse(request, 404)
         return HTTPResponse(request, 204)
 
-    team_membership_regex = re.compile(r'/orgs/(.*)/teams/(.*)/members/(.*)')
-
     def team_membership(request):
-        urlinfo = urlparse(request.url)
-        urlmatch = team_membership_regex.match(urlinfo.path)
-        org = urlmatch.group(1)
-        team = urlmatch.group(2)
-        username = urlmatch.group(3)
-        print(f"Request org = {org}, team = {team} username = {username}")
+        # https://api.github.com/orgs/{org}/teams/{team}/members/{username}
+        url = request.url.partition('?')[0]
+        _, org, _, team, _, username = url.rsplit('/', 6)[-6:]
         if org not in allowed_org_members:
-            print(f"Org not found: org = {org}")
+            log.debug("Org not found: org=%s", org)
             return HTTPResponse(request, 404)
         if team not in allowed_org_team_members[org]:
-            print(f"Team not found in org: team = {team}, org = {org}")
+            log.debug("Team not found in org: team=%s org=%s", team, org)
             return HTTPResponse(request, 404)
         if username not in allowed_org_team_members[org][team]:
-            print(
-                f"Member not found: org = {org}, team = {team}, username = {username}"
+            log.debug(
+                "Member not found: org=%s team=%s username=%s", org, team, username
             )
             return HTTPResponse(request, 404)
         return HTTPResponse(request, 204)
 
     ## Perform tests
 
-    client_hosts = github_client.hosts['api.github.com']
-    client_hosts.append((team_membership_regex, team_membership))
-    client_hosts.append((org_membership_regex, org_membership))
-
-    # Run tests twice, once with paginate and once without
-    for paginate in (False, True):
-        client_hosts.append((member_regex, functools.partial(org_members, paginate)))
+    async def authenticate(*usernames):
+        handlers = [github_client.handler_for_user(user_model(u)) for u in usernames]
+        return await asyncio.gather(
+            *(authenticator.get_authenticated_user(h, None) for h in handlers)
+        )
 
+    with added_hosts(
+        github_client.hosts['api.github.com'],
+        (_TEAM_MEMBERSHIP_RE, team_membership),
+        (_ORG_MEMBERSHIP_RE, org_membership),
+        (_MEMBER_RE, org_members),
+    ):
         # test org membership
         authenticator.allowed_organizations = ["org1"]
 
-        handled_user_model = user_model("user1")
-        handler = github_client.handler_for_user(handled_user_model)
-        auth_model = await authenticator.get_authenticated_user(handler, None)
-        assert auth_model
-
-        handled_user_model = user_model("user-not-in-org")
-        handler = github_client.handler_for_user(handled_user_model)
-        auth_model = await authenticator.get_authenticated_user(handler, None)
-        assert auth_model is None
+        auth_models = await authenticate("user1", "user-not-in-org")
+        assert auth_models[0]
+        assert auth_models[1] is None
 
         # test org team membership
         authenticator.allowed_organizations = ["org1:team1"]
 
-        handled_user_model = user_model("user1")
-        handler = github_client.handler_for_user(handled_user_model)
-        auth_model = await authenticator.get_authenticated_user(handler, None)
-        assert auth_model
-
-        handled_user_model = user_model("user-not-in-org-team")
-        handler = github_client.handler_for_user(handled_user_model)
-        auth_model = await authenticator.get_authenticated_user(handler, None)
-        assert auth_model is None
+        auth_models = await authenticate("user1", "user-not-in-org-team")
+        assert auth_models[0]
+        assert auth_models[1] is None
 
-        client_hosts.pop()
+        # test listing org members, following the Link headers when paginated
+        members = await authenticator._paginated_fetch(
+            "https://api.github.com/orgs/org1/members", "token", "token"
+        )
+        assert [m["login"] for m in members] == ["user1", "user2"]
 
 
 @mark.parametrize(
@@ -244,7 +287,7 @@ async def test_allowed_org_membership(github_client):
         ),
     ],
 )
-async def test_deprecated_config(
+def test_deprecated_config(
     caplog,
     test_variation_id,
     class_config,
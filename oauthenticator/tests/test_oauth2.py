@@ -1,8 +1,8 @@
-import re
-import uuid
+from io import BytesIO
 from unittest.mock import Mock, PropertyMock
 
 from pytest import mark, raises
+from tornado.httpclient import AsyncHTTPClient, HTTPResponse
 from tornado.web import HTTPError
 from traitlets.config import Config
 
@@ -18,9 +18,9 @@ from ..oauth2 import (
 from .mocks import mock_handler, mock_login_user_coro
 
 
-async def test_serialize_state():
+def test_serialize_state():
     state1 = {
-        'state_id': uuid.uuid4().hex,
+        'state_id': '0123456789abcdef0123456789abcdef',
         'next': 'url',
     }
     b64_state = _serialize_state(state1)
@@ -143,27 +143,31 @@ async def test_custom_logout(monkeypatch):
     logout_handler.clear_cookie.assert_called_once_with(STATE_COOKIE_NAME)
 
 
-async def test_httpfetch(client):
+async def test_httpfetch():
     authenticator = OAuthenticator()
     authenticator.http_request_kwargs = {
         "proxy_host": "proxy.example.org",
         "proxy_port": 8080,
     }
 
-    # Return request fields as the response so we can examine it
-    client.add_host(
-        "example.org",
-        [
-            (
-                re.compile(".*"),
-                lambda req: [req.url, req.method, req.proxy_host, req.proxy_port],
-            ),
-        ],
+    async def fetch(req, **kwargs):
+        return HTTPResponse(req, 200, buffer=BytesIO(b'{"ok": true}'))
+
+    # Intercept requests instead of passing them through a mocked client, the
+    # request is captured so we can examine it
+    authenticator.http_client = Mock(
+        spec=AsyncHTTPClient, fetch=Mock(side_effect=fetch)
     )
-    authenticator.http_client = client
 
     r = await authenticator.httpfetch("http://example.org/a")
-    assert r == ['http://example.org/a', 'GET', "proxy.example.org", 8080]
+    assert r == {"ok": True}
+
+    authenticator.http_client.fetch.assert_called_once()
+    req = authenticator.http_client.fetch.call_args.args[0]
+    assert req.url == 'http://example.org/a'
+    assert req.method == 'GET'
+    assert req.proxy_host == "proxy.example.org"
+    assert req.proxy_port == 8080
 
 
 @mark.parametrize(
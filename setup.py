@@ -103,6 +103,7 @@ setup_args['extras_require'] = {
         # FIXME: unpin pytest-asyncio
         'pytest-asyncio>=0.17,<0.23',
         'pytest-cov',
+        'pytest-xdist',
         'requests-mock',
         # dependencies from googlegroups:
         'google-api-python-client',